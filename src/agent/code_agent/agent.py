@@ -1,19 +1,71 @@
 from config import settings
 
+import asyncio
+import base64
 import logging
-from typing import List, TypedDict, Any, Annotated
-from github import Github, Repository, GithubException
+import re
+from collections import OrderedDict, deque
+from typing import List, TypedDict, Any, Annotated, Callable
+from urllib.parse import quote
+
+import httpx
+import orjson
 
 from langgraph.graph.message import add_messages
 from langchain_gigachat import GigaChat
-from langchain_core.messages import SystemMessage, HumanMessage, BaseMessage, AIMessage
-from langgraph.checkpoint.memory import InMemorySaver
+from langchain_core.messages import SystemMessage, HumanMessage, BaseMessage, AIMessage, ToolMessage
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
 from langchain_gigachat.tools.giga_tool import giga_tool
 from langgraph.graph import StateGraph, END
-from langgraph.prebuilt import ToolNode
 
 logger = logging.getLogger(__name__)
 
+GITHUB_API_URL = "https://api.github.com"
+LIST_FILES_LIMIT = 50
+TREE_CACHE_SIZE = 32
+ETAG_CACHE_SIZE = 1024
+# Bodies are kept in memory: cap the total, and do not keep single bodies
+# (large raw files, recursive trees of big repos) above the per-entry limit.
+ETAG_CACHE_BYTES = 64 * 1024 * 1024
+ETAG_CACHE_MAX_BODY = 1024 * 1024
+# Everything str.isalnum() rejects: non-word characters and underscore.
+_SLUG_RE = re.compile(r"[\W_]")
+
+# The agent talks to the REST/GraphQL API directly so it never blocks the
+# event loop; all calls share one HTTP/2 connection pool.
+_client = httpx.AsyncClient(
+    base_url=GITHUB_API_URL,
+    headers={
+        "Authorization": f"Bearer {settings.github_token}",
+        "Accept": "application/vnd.github+json",
+    },
+    http2=True,
+    limits=httpx.Limits(max_keepalive_connections=20),
+    timeout=60
+)
+
+# The next three caches hold asyncio tasks, so concurrent tool calls share
+# one in-flight request per key (see _cached_task).
+_default_branches = {}
+# Default branch head per repository, resolved once per agent run.
+_head_shas = {}
+# (repo_full_name, commit sha) -> (paths of all blobs in the recursive tree,
+# whether GitHub truncated the tree).
+_blob_paths = OrderedDict()
+# Request key -> (etag, body) of the last 200 answer, sent back as If-None-Match.
+_etag_cache = OrderedDict()
+_etag_cache_bytes = 0
+
+
+async def close_github_client():
+    """Closes the shared HTTP client of the tools; call on app shutdown."""
+    await _client.aclose()
+
+
+class FileChange(TypedDict):
+    path: str
+    content: str
+
 
 class AgentState(TypedDict):
     repo: Any 
@@ -24,6 +76,265 @@ class AgentState(TypedDict):
     messages: Annotated[List[BaseMessage], add_messages]
 
 
+async def _conditional_get(
+    url: str,
+    params: dict = None,
+    headers: dict = None,
+    cache_key: tuple = None,
+    check: Callable[[httpx.Response], None] = None
+) -> bytes:
+    """
+    GET with If-None-Match. A 304 does not count against the primary rate
+    limit and carries no body; the body stored with the ETag is returned.
+
+    By default requests are keyed by url, params and headers; pass
+    `cache_key` to share a validator between requests for the same resource.
+    `check` may raise to reject a 200 response before it is cached.
+    """
+    if cache_key is None:
+        cache_key = (url, tuple(sorted((params or {}).items())), tuple(sorted((headers or {}).items())))
+    headers = dict(headers or {})
+    cached = _etag_cache.get(cache_key)
+    if cached is not None:
+        headers["If-None-Match"] = cached[0]
+
+    response = await _client.get(url, params=params, headers=headers)
+    if response.status_code == 304 and cached is not None:
+        # A concurrent call may have evicted or replaced the entry meanwhile;
+        # store the validated copy again instead of assuming it is still there.
+        _store_etag(cache_key, *cached)
+        return cached[1]
+    response.raise_for_status()
+    if check is not None:
+        check(response)
+
+    _store_etag(cache_key, response.headers.get("etag"), response.content)
+    return response.content
+
+
+def _store_etag(cache_key: tuple, etag: str, body: bytes):
+    global _etag_cache_bytes
+
+    previous = _etag_cache.pop(cache_key, None)
+    if previous is not None:
+        _etag_cache_bytes -= len(previous[1])
+    if not etag or len(body) > ETAG_CACHE_MAX_BODY:
+        return
+
+    _etag_cache[cache_key] = (etag, body)
+    _etag_cache_bytes += len(body)
+    while len(_etag_cache) > ETAG_CACHE_SIZE or _etag_cache_bytes > ETAG_CACHE_BYTES:
+        _, (_, evicted) = _etag_cache.popitem(last=False)
+        _etag_cache_bytes -= len(evicted)
+
+
+async def _get_json(url: str, **params) -> Any:
+    return orjson.loads(await _conditional_get(url, params=params))
+
+
+async def _cached_task(cache: dict, key, factory: Callable, max_size: int = None) -> Any:
+    """
+    Returns the result of `factory()` for `key`, starting it at most once:
+    concurrent callers await the same task and later callers get its result.
+    A failed task is dropped so the next call retries.
+    """
+    task = cache.get(key)
+    if task is None:
+        task = asyncio.ensure_future(factory())
+        cache[key] = task
+        if max_size is not None:
+            while len(cache) > max_size:
+                cache.popitem(last=False)
+    try:
+        # shield: a cancelled caller must not cancel the task other callers share.
+        return await asyncio.shield(task)
+    except Exception:
+        if cache.get(key) is task:
+            del cache[key]
+        raise
+
+
+async def _default_branch(repo_full_name: str) -> str:
+    async def fetch():
+        return (await _get_json(f"/repos/{repo_full_name}"))["default_branch"]
+    return await _cached_task(_default_branches, repo_full_name, fetch)
+
+
+async def _head_sha(repo_full_name: str) -> str:
+    async def fetch():
+        branch = await _default_branch(repo_full_name)
+        data = await _get_json(f"/repos/{repo_full_name}/branches/{quote(branch)}")
+        return data["commit"]["sha"]
+    return await _cached_task(_head_shas, repo_full_name, fetch)
+
+
+async def _tree_blob_paths(repo_full_name: str, commit_sha: str) -> tuple:
+    async def fetch():
+        data = await _get_json(f"/repos/{repo_full_name}/git/trees/{commit_sha}", recursive=1)
+        paths = (entry["path"] for entry in data["tree"] if entry["type"] == "blob")
+        # The tree lists entries depth-first; a stable sort by depth restores the
+        # breadth-first order of _walk_files, so top-level files come first.
+        return tuple(sorted(paths, key=lambda path: path.count("/"))), data.get("truncated", False)
+    return await _cached_task(_blob_paths, (repo_full_name, commit_sha), fetch, TREE_CACHE_SIZE)
+
+
+async def _walk_files(repo_full_name: str, path: str, ref: str, limit: int) -> List[str]:
+    """
+    Breadth-first walk over the contents API, one request per directory.
+    Only used when the recursive tree is truncated; stops at `limit` files.
+    """
+    files = []
+    directories = deque([path])
+    while directories and len(files) < limit:
+        entries = await _get_json(f"/repos/{repo_full_name}/contents/{quote(directories.popleft())}", ref=ref)
+        if isinstance(entries, dict):
+            entries = [entries]
+        for entry in entries:
+            if entry["type"] == "dir":
+                directories.append(entry["path"])
+            else:
+                files.append(entry["path"])
+    return files[:limit]
+
+
+def _check_raw_file(response: httpx.Response):
+    # The raw media type does not apply to directories: GitHub answers with
+    # the JSON listing instead.
+    if response.headers.get("content-type", "").startswith("application/json"):
+        raise ValueError("is not a file")
+    try:
+        response.content.decode("utf-8")
+    except UnicodeDecodeError:
+        raise ValueError("is not a UTF-8 text file")
+
+
+async def _read_file(repo_full_name: str, file_path: str, ref: str) -> str:
+    # Keyed without the ref, so reading the file at a newer commit revalidates
+    # the previous copy and an unchanged file costs only a 304.
+    try:
+        body = await _conditional_get(
+            f"/repos/{repo_full_name}/contents/{quote(file_path)}",
+            params={"ref": ref},
+            headers={"Accept": "application/vnd.github.v3.raw"},
+            cache_key=("raw", repo_full_name, file_path),
+            check=_check_raw_file
+        )
+    except ValueError as e:
+        raise ValueError(f"{file_path} {e}")
+    return body.decode("utf-8")
+
+
+async def _read_files(repo_full_name: str, paths: List[str], ref: str) -> dict:
+    """Returns {path: content}; paths that could not be read map to None."""
+    owner, name = repo_full_name.split("/", 1)
+    variables = {"owner": owner, "name": name}
+    params = ["$owner: String!", "$name: String!"]
+    fields = []
+    for i, path in enumerate(paths):
+        variables[f"p{i}"] = f"{ref}:{path}"
+        params.append(f"$p{i}: String!")
+        fields.append(f"f{i}: object(expression: $p{i}) {{ ... on Blob {{ text isBinary isTruncated }} }}")
+
+    query = f"query({', '.join(params)}) {{ repository(owner: $owner, name: $name) {{ {' '.join(fields)} }} }}"
+    response = await _client.post("/graphql", json={"query": query, "variables": variables})
+    response.raise_for_status()
+    data = response.json()
+    if data.get("errors"):
+        raise RuntimeError("; ".join(error["message"] for error in data["errors"]))
+
+    repository = data["data"]["repository"]
+    files = {}
+    truncated = []
+    for i, path in enumerate(paths):
+        blob = repository.get(f"f{i}")
+        if blob and blob.get("isTruncated") and not blob.get("isBinary"):
+            truncated.append(path)
+        else:
+            files[path] = None if not blob or blob.get("isBinary") else blob.get("text")
+
+    # GraphQL cuts the text of large blobs; fetch those over raw REST instead.
+    contents = await asyncio.gather(
+        *(_read_file(repo_full_name, path, ref) for path in truncated),
+        return_exceptions=True
+    )
+    for path, content in zip(truncated, contents):
+        files[path] = None if isinstance(content, Exception) else content
+    return files
+
+
+async def _ensure_branch(repo_full_name: str, branch: str) -> str:
+    """Creates the branch from the default branch head if needed; returns its head sha."""
+    try:
+        return (await _get_json(f"/repos/{repo_full_name}/branches/{quote(branch)}"))["commit"]["sha"]
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code != 404:
+            raise
+
+    response = await _client.post(
+        f"/repos/{repo_full_name}/git/refs",
+        json={"ref": f"refs/heads/{branch}", "sha": await _head_sha(repo_full_name)}
+    )
+    response.raise_for_status()
+    return response.json()["object"]["sha"]
+
+
+async def _update_file(repo_full_name: str, file_path: str, new_content: str, commit_message: str, branch: str) -> str:
+    await _ensure_branch(repo_full_name, branch)
+
+    url = f"/repos/{repo_full_name}/contents/{quote(file_path)}"
+    payload = {
+        "message": commit_message,
+        "content": base64.b64encode(new_content.encode("utf-8")).decode("ascii"),
+        "branch": branch
+    }
+    try:
+        payload["sha"] = (await _get_json(url, ref=branch))["sha"]
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code != 404:
+            raise
+
+    response = await _client.put(url, json=payload)
+    response.raise_for_status()
+    if "sha" in payload:
+        return f"Updated {file_path} on {branch}"
+    return f"Created {file_path} on {branch}"
+
+
+async def _post_json(url: str, payload: dict) -> Any:
+    response = await _client.post(url, json=payload)
+    response.raise_for_status()
+    return response.json()
+
+
+async def _update_files(repo_full_name: str, branch: str, files: List[FileChange], commit_message: str) -> str:
+    head_sha = await _ensure_branch(repo_full_name, branch)
+    head_commit = await _get_json(f"/repos/{repo_full_name}/git/commits/{head_sha}")
+
+    blobs = await asyncio.gather(*(
+        _post_json(f"/repos/{repo_full_name}/git/blobs", {"content": file["content"], "encoding": "utf-8"})
+        for file in files
+    ))
+    tree = await _post_json(f"/repos/{repo_full_name}/git/trees", {
+        "base_tree": head_commit["tree"]["sha"],
+        "tree": [
+            {"path": file["path"], "mode": "100644", "type": "blob", "sha": blob["sha"]}
+            for file, blob in zip(files, blobs)
+        ]
+    })
+    commit = await _post_json(f"/repos/{repo_full_name}/git/commits", {
+        "message": commit_message,
+        "tree": tree["sha"],
+        "parents": [head_sha]
+    })
+
+    response = await _client.patch(
+        f"/repos/{repo_full_name}/git/refs/heads/{quote(branch)}",
+        json={"sha": commit["sha"]}
+    )
+    response.raise_for_status()
+    return f"Committed {len(files)} files to {branch}: " + ", ".join(file["path"] for file in files)
+
+
 @giga_tool
 async def list_files(repo_full_name: str, path: str = "") -> str:
     """
@@ -32,18 +343,19 @@ async def list_files(repo_full_name: str, path: str = "") -> str:
         repo_full_name: The owner/repo string (e.g. 'langchain/langchain')
         path: The directory path to list (default is root)
     """
-    g = Github(settings.github_token)
-    repo = g.get_repo(repo_full_name)
     try:
-        contents = repo.get_contents(path)
-        files = []
-        while contents:
-            file_content = contents.pop(0)
-            if file_content.type == "dir":
-                contents.extend(repo.get_contents(file_content.path))
-            else:
-                files.append(file_content.path)
-        return "\n".join(files[:50])
+        prefix = path.strip("/")
+        if prefix:
+            prefix += "/"
+
+        ref = await _head_sha(repo_full_name)
+        paths, truncated = await _tree_blob_paths(repo_full_name, ref)
+        files = [file_path for file_path in paths if file_path.startswith(prefix)]
+        if truncated and len(files) < LIST_FILES_LIMIT:
+            files = await _walk_files(repo_full_name, prefix.rstrip("/"), ref, LIST_FILES_LIMIT)
+        if not files and prefix:
+            return f"Error listing files: no files under '{path}'"
+        return "\n".join(files[:LIST_FILES_LIMIT])
     except Exception as e:
         return f"Error listing files: {str(e)}"
 
@@ -56,77 +368,165 @@ async def read_file(repo_full_name: str, file_path: str) -> str:
         repo_full_name: The owner/repo string
         file_path: The full path to the file
     """
-    g = Github(settings.github_token)
-    repo = g.get_repo(repo_full_name)
     try:
-        contents = repo.get_contents(file_path)
-        return contents.decoded_content.decode("utf-8")
+        return await _read_file(repo_full_name, file_path, await _head_sha(repo_full_name))
     except Exception as e:
         return f"Error reading file: {str(e)}"
 
 
+@giga_tool
+async def read_files(repo_full_name: str, paths: List[str]) -> str:
+    """
+    Reads the contents of several files in one request. Prefer it over
+    multiple read_file calls.
+    Args:
+        repo_full_name: The owner/repo string
+        paths: Full paths of the files to read
+    """
+    if not paths:
+        return "Error reading files: no paths given"
+    try:
+        paths = list(dict.fromkeys(paths))
+        files = await _read_files(repo_full_name, paths, await _head_sha(repo_full_name))
+
+        parts = []
+        for path in paths:
+            content = files.get(path)
+            if content is None:
+                content = "Error reading file: not found, binary or too large"
+            parts.append(f"=== {path} ===\n{content}")
+        return "\n\n".join(parts)
+    except Exception as e:
+        return f"Error reading files: {str(e)}"
+
+
 @giga_tool
 async def update_file(repo_full_name: str, file_path: str, new_content: str, commit_message: str, branch: str) -> str:
     """
     Updates or creates a file in the repository on a specific branch.
     """
-    g = Github(settings.github_token)
-    repo = g.get_repo(repo_full_name)
-
     try:
-        try:
-            repo.get_branch(branch)
-        except GithubException:
-            source = repo.get_branch(repo.default_branch)
-            repo.create_git_ref(ref=f"refs/heads/{branch}", sha=source.commit.sha)
-
-        try:
-            contents = repo.get_contents(file_path, ref=branch)
-            repo.update_file(contents.path, commit_message, new_content, contents.sha, branch=branch)
-            return f"Updated {file_path} on {branch}"
-        except GithubException:
-            repo.create_file(file_path, commit_message, new_content, branch=branch)
-            return f"Created {file_path} on {branch}"
-
+        return await _update_file(repo_full_name, file_path, new_content, commit_message, branch)
     except Exception as e:
         return f"Error committing to file: {str(e)}"
 
 
-async def agent_node(state: AgentState):
-    logger.info(f"Code agents messages: {state['messages']}")
+@giga_tool
+async def update_files(repo_full_name: str, branch: str, files: List[FileChange], commit_message: str) -> str:
+    """
+    Updates or creates several files on a branch in a single commit. Prefer
+    it over multiple update_file calls.
+    Args:
+        repo_full_name: The owner/repo string
+        branch: The branch to commit to
+        files: Files to write, each with a full `path` and the new `content`
+        commit_message: Message of the commit
+    """
+    if not files:
+        return "Error committing files: no files given"
+    try:
+        return await _update_files(repo_full_name, branch, files, commit_message)
+    except Exception as e:
+        return f"Error committing files: {str(e)}"
 
-    repo_name = state["repo_full_name"]
 
-    llm = GigaChat(
-        model="Gigachat-2-Max",
-        temperature=0,
-        verify_ssl_certs=False,
-        credentials=settings.llm_token,
-        scope="GIGACHAT_API_PERS",
-        timeout=1200
-    )
-    tools = [list_files, read_file, update_file]
-    llm_with_tools = llm.bind_tools(tools)
+TOOLS = [list_files, read_file, read_files, update_file, update_files]
+TOOLS_BY_NAME = {t.name: t for t in TOOLS}
+# Tools that write to the repository. Every write moves the branch head, so
+# writes to the same branch run one after another; everything else is
+# dispatched concurrently.
+WRITE_TOOLS = {"update_file", "update_files"}
+
+# Built once: the client keeps its session and token, and the tool schemas
+# are serialized a single time instead of on every agent step.
+_llm_with_tools = GigaChat(
+    model="Gigachat-2-Max",
+    temperature=0,
+    verify_ssl_certs=False,
+    credentials=settings.llm_token,
+    scope="GIGACHAT_API_PERS",
+    timeout=1200
+).bind_tools(TOOLS)
+
+
+def _call_key(call) -> tuple:
+    return call["name"], orjson.dumps(call["args"], option=orjson.OPT_SORT_KEYS)
+
+
+async def tools_node(state: AgentState):
+    """
+    Executes all tool calls of the last LLM turn concurrently.
+
+    Identical calls (same tool, same arguments) are executed once and the
+    result is returned to each of them. The number of simultaneously running
+    calls is capped by `settings.tool_concurrency_limit` (env TOOL_CONCURRENCY_LIMIT).
+    """
+    tool_calls = state["messages"][-1].tool_calls
+    semaphore = asyncio.Semaphore(settings.tool_concurrency_limit)
+
+    unique_calls = {}
+    for call in tool_calls:
+        unique_calls.setdefault(_call_key(call), call)
+
+    lanes = {}
+    for key, call in unique_calls.items():
+        if call["name"] in WRITE_TOOLS:
+            lane = ("write", call["args"].get("branch"))
+        else:
+            lane = ("read", key)
+        lanes.setdefault(lane, []).append(key)
+
+    async def run_call(call) -> str:
+        tool = TOOLS_BY_NAME.get(call["name"])
+        if tool is None:
+            return f"Error: unknown tool {call['name']}"
+        async with semaphore:
+            try:
+                return str(await tool.ainvoke(call["args"]))
+            except Exception as e:
+                return f"Error calling {call['name']}: {str(e)}"
+
+    async def run_lane(keys) -> List[tuple]:
+        return [(key, await run_call(unique_calls[key])) for key in keys]
+
+    lane_results = await asyncio.gather(*(run_lane(keys) for keys in lanes.values()))
+    results = dict(result for lane in lane_results for result in lane)
+
+    return {
+        "messages": [
+            ToolMessage(content=results[_call_key(call)], name=call["name"], tool_call_id=call["id"])
+            for call in tool_calls
+        ]
+    }
+
 
-    sys_msg = SystemMessage(content=f"""
-    Ты агент-кодер. Репозиторий: {repo_name}.
+SYSTEM_PROMPT = """
+    Ты агент-кодер. Репозиторий: {repo_full_name}.
 
-    Задача: Исправить проблему "{state['issue_title']}"
-    Контекст: {state['issue_desc']}
-    Целевая ветка: {state['branch_name']}
+    Задача: Исправить проблему "{issue_title}"
+    Контекст: {issue_desc}
+    Целевая ветка: {branch_name}
     
-    1. Изучите код (`list_files`, `read_file`).
-    2. Создайте/Обновите файлы (`update_file`). *Всегда* передавайте '{repo_name}' в качестве аргумента repo_full_name.
+    1. Изучите код (`list_files`, `read_file`). Если нужно прочитать несколько файлов, читайте их одним вызовом `read_files`.
+    2. Создайте/Обновите файлы (`update_file`). Если меняете несколько файлов, запишите их одним коммитом через `update_files`. *Всегда* передавайте '{repo_full_name}' в качестве аргумента repo_full_name.
     3. После завершения ответь строго "READY_FOR_PR".
-    """)
+    """
+
+
+def build_system_message(state: AgentState) -> SystemMessage:
+    """
+    Built once per run and stored as the first message of the state; the
+    add_messages reducer only appends after it, so the prompt prefix stays
+    the same on every turn.
+    """
+    return SystemMessage(content=SYSTEM_PROMPT.format_map(state))
 
-    messages = state["messages"]
 
-    if not messages or not isinstance(messages[0], SystemMessage):
-        messages = [sys_msg] + messages
+async def agent_node(state: AgentState):
+    logger.info("Code agents messages: %s", state["messages"])
 
-    response = await llm_with_tools.ainvoke(messages)
-    logger.info(f"LLM call: {response}")
+    response = await _llm_with_tools.ainvoke(state["messages"])
+    logger.info("LLM call: %s", response)
 
     return {"messages": [response]}
 
@@ -141,38 +541,45 @@ def should_continue(state: AgentState):
 async def create_pr_node(state: AgentState):
     title = f"Fix: {state['issue_title']}"
     body = f"Automated PR for: {state['issue_desc']}"
-    g = Github(settings.github_token)
-    repo = g.get_repo(state["repo_full_name"])
+    repo_full_name = state["repo_full_name"]
 
     try:
-        pr = repo.create_pull(
-            title=title,
-            body=body,
-            head=state["branch_name"],
-            base=repo.default_branch
+        response = await _client.post(
+            f"/repos/{repo_full_name}/pulls",
+            json={
+                "title": title,
+                "body": body,
+                "head": state["branch_name"],
+                "base": await _default_branch(repo_full_name)
+            }
         )
-        return {"messages": [AIMessage(content=f"PR Created: {pr.html_url}")]}
+        response.raise_for_status()
+        return {"messages": [AIMessage(content=f"PR Created: {response.json()['html_url']}")]}
     except Exception as e:
         return {"messages": [AIMessage(content=f"PR Failed: {str(e)}")]}
 
 
-async def run_coding_agent(repo: Repository, issue_title: str, issue_desc: str) -> str:
+async def run_coding_agent(repo_full_name: str, issue_number: int, issue_title: str, issue_desc: str) -> str:
     """
     The main entry point to run the agent.
 
+    Checkpoints are stored in `settings.checkpoint_db` under one thread per
+    issue. Nothing is resumed on startup: when the same issue is delivered
+    again, an unfinished run continues from its last checkpoint and a
+    finished one returns its stored result.
+
     Args:
-        repo: A PyGithub Repository object.
+        repo_full_name: The owner/repo string of the repository to fix.
+        issue_number: Number of the issue, used as the checkpoint thread id.
         issue_title: Title of the issue to fix.
         issue_desc: Detailed description of the issue.
 
     Returns:
         str: The final output (e.g., the PR URL or error message).
     """
-    tool_node = ToolNode([list_files, read_file, update_file])
-
     workflow = StateGraph(AgentState)
     workflow.add_node("agent", agent_node)
-    workflow.add_node("tools", tool_node)
+    workflow.add_node("tools", tools_node)
     workflow.add_node("create_pr", create_pr_node)
 
     workflow.set_entry_point("agent")
@@ -180,25 +587,42 @@ async def run_coding_agent(repo: Repository, issue_title: str, issue_desc: str)
     workflow.add_edge("tools", "agent")
     workflow.add_edge("create_pr", END)
 
-    app = workflow.compile(
-        checkpointer=InMemorySaver(),
-        debug=True
-    )
+    # Re-resolve the default branch head so this run does not read a stale tree.
+    _head_shas.pop(repo_full_name, None)
 
-    safe_title = "".join(c if c.isalnum() else "-" for c in issue_title.lower())[:30]
+    safe_title = _SLUG_RE.sub("-", issue_title.lower())[:30]
     branch_name = f"agent/fix-{safe_title}"
 
     initial_state = {
-        "repo_full_name": repo.full_name,
+        "repo_full_name": repo_full_name,
         "issue_title": issue_title,
         "issue_desc": issue_desc,
-        "branch_name": branch_name,
-        "messages": [HumanMessage(content="Приступай к диагностике и исправлению.")]
+        "branch_name": branch_name
     }
+    initial_state["messages"] = [
+        build_system_message(initial_state),
+        HumanMessage(content="Приступай к диагностике и исправлению.")
+    ]
 
-    logger.info(f"--- Agent Started on {repo.full_name} (Branch: {branch_name}) ---")
-    final_output = ""
+    config = {"configurable": {"thread_id": f"{repo_full_name}#{issue_number}"}}
+
+    async with AsyncSqliteSaver.from_conn_string(settings.checkpoint_db) as checkpointer:
+        app = workflow.compile(
+            checkpointer=checkpointer,
+            debug=True
+        )
 
-    resp = await app.ainvoke(initial_state, {"configurable": {"thread_id": "1"}})
+        snapshot = await app.aget_state(config)
+        if snapshot.values and not snapshot.next:
+            # The issue was already handled (e.g. a redelivered webhook); do not
+            # append a second prompt to the finished transcript.
+            logger.info("--- Agent already finished on %s (Branch: %s) ---", repo_full_name, branch_name)
+            return snapshot.values["messages"][-1].content
+        if snapshot.next:
+            logger.info("--- Agent Resumed on %s (Branch: %s) ---", repo_full_name, branch_name)
+            resp = await app.ainvoke(None, config)
+        else:
+            logger.info("--- Agent Started on %s (Branch: %s) ---", repo_full_name, branch_name)
+            resp = await app.ainvoke(initial_state, config)
 
     return resp['messages'][-1].content
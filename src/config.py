@@ -1,3 +1,4 @@
+from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -6,6 +7,8 @@ class Settings(BaseSettings):
     github_token: str
     llm_token: str
     repo_name: str = "Kokande/geoProjFastApi"
+    tool_concurrency_limit: int = Field(4, ge=1)
+    checkpoint_db: str = "agent_state.db"
 
     model_config = SettingsConfigDict(
         env_file=(
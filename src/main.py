@@ -1,24 +1,40 @@
 from config import settings
-from agent.code_agent.agent import run_coding_agent
+from agent.code_agent.agent import run_coding_agent, close_github_client
 
 import sys
-import json
+import asyncio
 import logging
+from contextlib import asynccontextmanager
 
+import orjson
 from github import Auth
 from github import Github
 import uvicorn
-from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi import BackgroundTasks, FastAPI, Request
+from fastapi.responses import ORJSONResponse
+from langchain_core.caches import InMemoryCache
+from langchain_core.globals import set_llm_cache
 
-app = FastAPI(title="Coding Agent")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # lazy=True defers GET /repos/{owner}/{repo} until the repo is first used,
+    # so startup does no network I/O and survives a GitHub outage.
+    github_client = Github(auth=Auth.Token(settings.github_token))
+    app.state.repo = github_client.get_repo(settings.repo_name, lazy=True)
+    yield
+    github_client.close()
+    await close_github_client()
+
+
+app = FastAPI(title="Coding Agent", lifespan=lifespan, default_response_class=ORJSONResponse)
 logger = logging.getLogger(__name__)
 log_config = uvicorn.config.LOGGING_CONFIG
 log_config["formatters"]["access"]["fmt"] = '%(asctime)s - %(levelname)s - %(message)s'
 log_config["formatters"]["default"]["fmt"] = '%(asctime)s - %(levelname)s - %(message)s'
 
-github_client = Github(auth=Auth.Token(settings.github_token))
-repo = github_client.get_repo(settings.repo_name)
+# Identical LLM requests (same conversation, same tools) are answered from memory.
+set_llm_cache(InMemoryCache(maxsize=256))
 
 logging.basicConfig(
     level=logging.INFO,
@@ -48,25 +64,36 @@ async def health():
     return {"status": "ok"}
 
 
+async def process_issue(repo, issue_number: int):
+    """Runs the coding agent for an issue after the webhook has been answered."""
+    try:
+        issue = await asyncio.to_thread(repo.get_issue, number=issue_number)
+        logger.info("Issue content: %s - %s", issue.title, issue.body)
+
+        logger.info(await run_coding_agent(settings.repo_name, issue_number, issue.title, issue.body))
+    except Exception as e:
+        logger.error("Error processing issue #%s: %s", issue_number, e, exc_info=True)
+
+
 @app.post("/webhook")
-async def github_webhook(request: Request):
+async def github_webhook(request: Request, background_tasks: BackgroundTasks):
     try:
         x_github_event = request.headers.get("X-GitHub-Event")
         x_hub_signature_256 = request.headers.get("X-Hub-Signature-256")
 
-        logger.info(f"Event header: {x_github_event}")
-        logger.info(f"Signature header: {x_hub_signature_256}")
+        logger.info("Event header: %s", x_github_event)
+        logger.info("Signature header: %s", x_hub_signature_256)
 
         body = await request.body()
-        body_str = body.decode('utf-8')
 
-        logger.info(f"Body preview: {body_str[:500]}...")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Body preview: %s...", body[:500].decode("utf-8", "replace"))
 
         try:
-            payload = json.loads(body_str)
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON decode error: {e}")
-            return JSONResponse(
+            payload = orjson.loads(body)
+        except ValueError as e:
+            logger.error("JSON decode error: %s", e)
+            return ORJSONResponse(
                 status_code=400,
                 content={"error": "Invalid JSON"}
             )
@@ -77,21 +104,22 @@ async def github_webhook(request: Request):
 
         if x_github_event == "issues":
             action = payload.get("action")
-            logger.info(f"Received issues event with action: {action}")
+            logger.info("Received issues event with action: %s", action)
 
             if action == "opened":
-                issue = repo.get_issue(number=payload.get("issue").get("number"))
-                logger.info(f"Issue content: {issue.title} - {issue.body}")
-
-                logger.info(await run_coding_agent(repo, issue.title, issue.body))
+                issue_number = payload.get("issue").get("number")
+                background_tasks.add_task(process_issue, request.app.state.repo, issue_number)
 
-                return {"status": "processed"}
+                return ORJSONResponse(
+                    status_code=202,
+                    content={"status": "accepted"}
+                )
 
         return {"status": "received"}
 
     except Exception as e:
-        logger.error(f"Error in webhook handler: {e}", exc_info=True)
-        return JSONResponse(
+        logger.error("Error in webhook handler: %s", e, exc_info=True)
+        return ORJSONResponse(
             status_code=500,
             content={"error": "Internal server error"}
         )